@@ -1,10 +1,13 @@
 import fitz  # PyMuPDF
-import json
+import orjson
+import os
 import re
 from pathlib import Path
 import logging
-from collections import defaultdict
 import statistics
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, repeat
+from operator import attrgetter, itemgetter
 
 
 
@@ -14,6 +17,56 @@ import statistics
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Upper bound on worker processes used by main()
+MAX_WORKERS = 8
+
+# get_text("dict") flags without image extraction: image blocks are
+# skipped anyway, and decoding their pixel data is the expensive part
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Patterns to identify headers and footers, combined into one regex
+HEADER_FOOTER_PATTERN = re.compile(
+    r'(?:Page \d+ of \d+'
+    r'|© .+'
+    r'|Copyright .+'
+    r'|Version \d+\.\d+'
+    r'|\d{1,2} [A-Za-z]{3,9} \d{4}'  # Dates like "31 May 2014"
+    r'|ISTQB'
+    r'|Overview'
+    r'|Foundation Level Extension – Agile Tester'
+    r'|International Software Testing Qualifications Board'
+    r')$'
+)
+
+# Every header/footer pattern starts with one of these characters (or a
+# digit), so other lines can skip the regex entirely
+HEADER_FOOTER_FIRST_CHARS = frozenset('P©CVIOF')
+
+# Heading patterns combined into one regex; the named group that
+# matched tells us which kind of heading it is
+HEADING_PATTERN = re.compile(
+    r'(?P<h1>\d+\.\s+)'                                # "1. Introduction"
+    r'|(?P<h2>\d+\.\d+\s+)'                            # "2.1 Audience"
+    # Title Case; the optional colon is grouped with its trailing
+    # whitespace so the tail cannot backtrack over long whitespace runs
+    r'|(?P<title>[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\s*(?::\s*)?$)'
+)
+
+# Longer lines are never treated as headings; process_pdf applies this
+# before any regex runs, which caps the input size every pattern sees
+MAX_HEADING_LENGTH = 200
+
+# Known heading text
+KNOWN_HEADINGS = (
+    "Revision History",
+    "Table of Contents",
+    "Acknowledgements",
+    "References"
+)
+
+# Known headings as one regex, searched anywhere in the line
+KNOWN_HEADINGS_PATTERN = re.compile('|'.join(map(re.escape, KNOWN_HEADINGS)))
+
 
 class TextBlock:
     __slots__ = ('text', 'bbox', 'font_size', 'is_bold', 'page_num', 'y_pos')
@@ -28,35 +81,6 @@ class TextBlock:
 
 
 class PDFOutlineExtractor:
-    def __init__(self):
-        # Patterns to identify headers and footers
-        self.header_footer_patterns = [
-            r'^Page \d+ of \d+$',
-            r'^© .+$',
-            r'^Copyright .+$',
-            r'^Version \d+\.\d+$',
-            r'^\d{1,2} [A-Za-z]{3,9} \d{4}$',  # Dates like "31 May 2014"
-            r'^ISTQB$',
-            r'^Overview$',
-            r'^Foundation Level Extension – Agile Tester$',
-            r'^International Software Testing Qualifications Board$'
-        ]
-        
-        # Patterns to identify headings
-        self.heading_patterns = [
-            r'^\d+\.\s+',       # "1. Introduction"
-            r'^\d+\.\d+\s+',    # "2.1 Audience"
-            r'^[A-Z][a-z]+(\s+[A-Z][a-z]+)*\s*:?\s*$'  # Title Case
-        ]
-        
-        # Known heading text
-        self.known_headings = [
-            "Revision History",
-            "Table of Contents",
-            "Acknowledgements",
-            "References"
-        ]
-
     def _is_header_footer(self, text):
         """Check if text is a header or footer element"""
         text = text.strip()
@@ -64,12 +88,13 @@ class PDFOutlineExtractor:
             return True
             
         # Check against patterns
-        for pattern in self.header_footer_patterns:
-            if re.match(pattern, text):
+        first_char = text[0]
+        if first_char in HEADER_FOOTER_FIRST_CHARS or first_char.isdecimal():
+            if HEADER_FOOTER_PATTERN.match(text):
                 return True
                 
-        # Check for short text fragments
-        if len(text.split()) <= 2 and len(text) < 15:
+        # Check for short text fragments (cheap length test first)
+        if len(text) < 15 and len(text.split()) <= 2:
             return True
             
         return False
@@ -77,62 +102,56 @@ class PDFOutlineExtractor:
     def _is_heading_candidate(self, text):
         """Check if text could be a heading"""
         text = text.strip()
-        if not text or len(text) > 200:
+        if not text:
             return False
             
         # Check known headings
-        for heading in self.known_headings:
-            if heading in text:
-                return True
+        if KNOWN_HEADINGS_PATTERN.search(text):
+            return True
                 
         # Check against heading patterns
-        for pattern in self.heading_patterns:
-            if re.match(pattern, text):
-                return True
-                
-        return False
+        return HEADING_PATTERN.match(text) is not None
 
     def _get_heading_level(self, text):
         """Determine heading level based on patterns"""
+        match = HEADING_PATTERN.match(text)
+        kind = match.lastgroup if match else None
+        
         # H1: Main numbered sections
-        if re.match(r'^\d+\.\s+', text):
+        if kind == "h1":
             return "H1"
         
         # H2: Subsections
-        if re.match(r'^\d+\.\d+\s+', text):
+        if kind == "h2":
             return "H2"
         
         # H3: Known headings that should be H1
-        if any(heading in text for heading in self.known_headings):
+        if KNOWN_HEADINGS_PATTERN.search(text):
             return "H1"
             
         # Default to H2 for other headings
         return "H2"
 
     def _extract_text_blocks(self, pdf_path):
-        """Extract text blocks with line-based combining"""
-        all_blocks = []
-        doc = fitz.open(pdf_path)
-        
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            blocks = self._extract_text_blocks_from_page(page, page_num + 1)
-            all_blocks.extend(blocks)
-                    
-        doc.close()
-        return all_blocks
+        """Yield text blocks with line-based combining, one page at a time"""
+        # Pages are extracted serially: PyMuPDF is not thread-safe, so
+        # parallelism happens across PDFs in main() instead
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                yield from self._extract_text_blocks_from_page(page, page.number + 1)
 
     def _extract_text_blocks_from_page(self, page, page_num):
         """Extract text blocks from a single page"""
-        lines = defaultdict(list)
+        # Flat list of (y_key, x0, text, bbox, font_size, is_bold) line fragments
+        line_parts = []
         
         try:
-            text_dict = page.get_text("dict")
+            text_dict = page.get_text("dict", flags=TEXT_FLAGS)
             
             for block in text_dict.get("blocks", []):
                 if "lines" in block:
                     for line in block["lines"]:
-                        line_text = ""
+                        text_parts = []
                         font_size = 0
                         is_bold = False
                         bbox = line["bbox"]
@@ -143,64 +162,55 @@ class PDFOutlineExtractor:
                             if not span_text:
                                 continue
                                 
-                            line_text += span_text + " "
+                            text_parts.append(span_text)
                             font_size = span["size"]
                             is_bold = "bold" in span["font"].lower() or (span["flags"] & 16)
                         
-                        if line_text.strip():
+                        if text_parts:
                             # Group by approximate y-position
                             y_key = round(bbox[1], 0)
-                            lines[y_key].append(TextBlock(
-                                text=line_text,
-                                bbox=bbox,
-                                font_size=font_size,
-                                is_bold=is_bold,
-                                page_num=page_num
-                            ))
+                            line_parts.append((y_key, bbox[0], " ".join(text_parts), bbox, font_size, is_bold))
         
         except Exception as e:
             logger.error(f"Error extracting from page {page_num}: {e}")
         
-        # Combine fragments on same line
+        # Combine fragments on same line, building one TextBlock per line
+        # One stable sort by (y, x) puts each line's fragments together, left to right
+        line_parts.sort(key=itemgetter(0, 1))
         combined_blocks = []
-        for y_key in sorted(lines.keys()):
-            line_blocks = sorted(lines[y_key], key=lambda x: x.bbox[0])
+        for _, group in groupby(line_parts, key=itemgetter(0)):
+            group = list(group)
             
-            if line_blocks:
-                # Combine text from all blocks on this line
-                combined_text = " ".join(block.text for block in line_blocks)
-                first_block = line_blocks[0]
-                
-                combined_blocks.append(TextBlock(
-                    text=combined_text,
-                    bbox=first_block.bbox,
-                    font_size=first_block.font_size,
-                    is_bold=first_block.is_bold,
-                    page_num=page_num
-                ))
+            # First fragment (leftmost) provides the line's bbox and font info
+            _, _, _, bbox, font_size, is_bold = group[0]
+            combined_blocks.append(TextBlock(
+                text=" ".join(part[2] for part in group),
+                bbox=bbox,
+                font_size=font_size,
+                is_bold=is_bold,
+                page_num=page_num
+            ))
         
         return combined_blocks
 
-    def _extract_title(self, all_blocks):
+    def _extract_title(self, first_page_blocks):
         """Extract document title from largest text on first page"""
-        first_page_blocks = [b for b in all_blocks if b.page_num == 1]
         if not first_page_blocks:
             return ""
         
         # Find largest font size
         max_font_size = max(b.font_size for b in first_page_blocks)
         
-        # Get candidate title blocks
-        title_blocks = []
-        for block in first_page_blocks:
-            if block.font_size >= max_font_size * 0.8 and not self._is_header_footer(block.text):
-                title_blocks.append(block)
-        
-        # Sort by vertical position
-        title_blocks.sort(key=lambda x: x.y_pos)
+        # Get candidate title blocks, sorted by vertical position
+        min_font_size = max_font_size * 0.8
+        title_blocks = sorted(
+            (block for block in first_page_blocks
+             if block.font_size >= min_font_size and not self._is_header_footer(block.text)),
+            key=attrgetter('y_pos')
+        )
         
-        # Combine title parts
-        title = " ".join(block.text.strip() for block in title_blocks)
+        # Combine title parts (TextBlock text is already stripped)
+        title = " ".join(block.text for block in title_blocks)
         return title[:200]  # Limit length
 
     def process_pdf(self, pdf_path):
@@ -208,31 +218,29 @@ class PDFOutlineExtractor:
         logger.info(f"Processing PDF: {pdf_path}")
         
         try:
-            # Extract all text blocks
-            all_blocks = self._extract_text_blocks(pdf_path)
-            
-            if not all_blocks:
-                return {"title": "", "outline": []}
-            
-            # Extract title
-            title = self._extract_title(all_blocks)
-            
-            # Extract headings
+            # Extract headings while streaming blocks page by page;
+            # only the first page is kept around for the title
+            first_page_blocks = []
             outline = []
             seen_headings = set()
             
-            for block in all_blocks:
-                text = block.text.strip()
+            for block in self._extract_text_blocks(pdf_path):
+                if block.page_num == 1:
+                    first_page_blocks.append(block)
+                
+                text = block.text  # already stripped by TextBlock
                 
-                # Skip headers/footers and non-heading candidates
-                if self._is_header_footer(text) or not self._is_heading_candidate(text):
+                # Heading length limit lives here: skip overlong lines before
+                # any regex sees them, then headers/footers and non-heading candidates
+                if (len(text) > MAX_HEADING_LENGTH or self._is_header_footer(text)
+                        or not self._is_heading_candidate(text)):
                     continue
                 
                 # Get heading level
                 level = self._get_heading_level(text)
                 
                 # Create unique key to avoid duplicates
-                heading_key = f"{text}|{block.page_num}"
+                heading_key = (text, block.page_num)
                 if heading_key not in seen_headings:
                     seen_headings.add(heading_key)
                     outline.append({
@@ -241,8 +249,12 @@ class PDFOutlineExtractor:
                         "page": block.page_num
                     })
             
-            # Sort outline by page and position
-            outline.sort(key=lambda x: (x["page"], -outline.index(x) if outline else 0))
+            # Sort outline by page; the sort is stable, so headings keep
+            # their reading order within a page
+            outline.sort(key=lambda x: x["page"])
+            
+            # Extract title
+            title = self._extract_title(first_page_blocks)
             
             logger.info(f"Extracted {len(outline)} headings")
             return {"title": title, "outline": outline}
@@ -252,31 +264,44 @@ class PDFOutlineExtractor:
             return {"title": "", "outline": []}
 
 
+def _process_one(pdf_file, output_dir):
+    """Process a single PDF and write its JSON outline (runs in a worker process)"""
+    try:
+        logger.info(f"Processing: {pdf_file.name}")
+        # Instantiate inside the worker so nothing needs to be pickled
+        extractor = PDFOutlineExtractor()
+        result = extractor.process_pdf(str(pdf_file))
+        output_file = output_dir / f"{pdf_file.stem}.json"
+        
+        # orjson always emits UTF-8, matching json.dump(ensure_ascii=False)
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+        
+        logger.info(f"Saved result to: {output_file}")
+        
+    except Exception as e:
+        logger.error(f"Error processing {pdf_file.name}: {e}")
+
+
 def main():
     input_dir = Path("/app/input")
     output_dir = Path("/app/output")
     output_dir.mkdir(exist_ok=True)
     
-    extractor = PDFOutlineExtractor()
-    pdf_files = list(input_dir.glob("*.pdf"))
+    # Find all PDFs with a single directory scan
+    with os.scandir(input_dir) as entries:
+        pdf_files = [Path(entry.path) for entry in entries
+                     if entry.name.endswith(".pdf") and entry.is_file()]
     
     if not pdf_files:
         logger.warning("No PDF files found")
         return
     
-    for pdf_file in pdf_files:
-        try:
-            logger.info(f"Processing: {pdf_file.name}")
-            result = extractor.process_pdf(str(pdf_file))
-            output_file = output_dir / f"{pdf_file.stem}.json"
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(result, f, indent=2, ensure_ascii=False)
-            
-            logger.info(f"Saved result to: {output_file}")
-            
-        except Exception as e:
-            logger.error(f"Error processing {pdf_file.name}: {e}")
+    # PDFs are independent, so process them in parallel.
+    # Cap the worker count to keep PyMuPDF memory usage bounded.
+    max_workers = min(os.cpu_count() or 1, MAX_WORKERS, len(pdf_files))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(_process_one, pdf_files, repeat(output_dir)))
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 # test_local.py
+import os
 import sys
 import json
 from pathlib import Path
@@ -19,8 +20,10 @@ def test_corrected_extractor():
     input_dir.mkdir(exist_ok=True)
     output_dir.mkdir(exist_ok=True)
 
-    # Find all PDFs in input/
-    pdf_files = list(input_dir.glob("*.pdf"))
+    # Find all PDFs in input/ with a single directory scan
+    with os.scandir(input_dir) as entries:
+        pdf_files = [Path(entry.path) for entry in entries
+                     if entry.name.endswith(".pdf") and entry.is_file()]
 
     if not pdf_files:
         print(" No PDF files found in input directory")